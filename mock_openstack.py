@@ -1,102 +1,397 @@
 from fastapi import FastAPI, HTTPException, Request, Header, Depends
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import uuid, os, json, datetime
+from fastapi.responses import JSONResponse, Response
+from typing import Any
+import collections, contextlib, mmap, os, asyncio, secrets, time
+import msgspec
+import orjson
 
-app = FastAPI(title="Mock OpenStack API (Persistent)")
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await start_journal()
+    yield
+    await stop_journal()
+
+app = FastAPI(title="Mock OpenStack API (Persistent)", default_response_class=ORJSONResponse,
+              lifespan=lifespan)
 
 DATA_DIR = "./mock_data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+_now_iso_cache = (0, "")
+
 def now_iso():
-    return datetime.datetime.utcnow().isoformat() + "Z"
+    # Precisión de segundos; solo se reformatea cuando cambia el segundo.
+    global _now_iso_cache
+    sec = int(time.time())
+    if sec != _now_iso_cache[0]:
+        _now_iso_cache = (sec, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(sec)))
+    return _now_iso_cache[1]
 
 def load_data(name, default):
     file = os.path.join(DATA_DIR, f"{name}.json")
     if os.path.exists(file):
         try:
-            with open(file, "r") as f:
-                return json.load(f)
+            # orjson lee directamente del mapeo, sin copia intermedia a bytes.
+            with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
         except Exception:
             return default
     return default
 
 def save_data(name, data):
     file = os.path.join(DATA_DIR, f"{name}.json")
-    with open(file, "w") as f:
-        json.dump(data, f, indent=2)
+    # Se escribe a un .tmp y se reemplaza: un crash nunca deja un snapshot a medias.
+    tmp = file + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, file)
 
 # --- Mock Data (Persistent) ---
+# Fecha fija para los datos semilla, la misma que traen los mock_data/*.json.
+SEED_CREATED_AT = "2024-08-01T00:00:00Z"
+
 USERS = load_data("users", {
     "admin": {"password": "secret", "id": "user-1", "role": "admin", "domain": "default"},
     "demo":  {"password": "test",   "id": "user-2", "role": "user",  "domain": "default"},
 })
-TOKENS: Dict[str, str] = load_data("tokens", {})  # token: user_id
-IMAGES = load_data("images", [
-    {"id": str(uuid.uuid4()), "name": "Cirros", "status": "active", "size": 13287936,
+TOKENS: dict[str, str] = {}  # token: user_id (solo en memoria, un reinicio los invalida)
+VALID_TOKENS: set[bytes] = set()  # mismos tokens, como bytes tal cual llegan en el scope ASGI
+IMAGES_BY_ID: dict[str, dict] = {i["id"]: i for i in load_data("images", [
+    {"id": "img-1", "name": "Cirros", "status": "active", "size": 13287936,
      "visibility": "public", "container_format": "bare", "disk_format": "qcow2",
-     "created_at": now_iso()}
-])
-VOLUMES = load_data("volumes", [
-    {"id": str(uuid.uuid4()), "name": "vol-1", "size": 1, "status": "available"}
-])
-SERVERS = load_data("servers", [
-    {"id": str(uuid.uuid4()), "name": "server-1", "status": "ACTIVE"}
-])
-ATTACHMENTS = load_data("attachments", [])
-
-def persist_all():
-    save_data("users", USERS)
-    save_data("tokens", TOKENS)
-    save_data("images", IMAGES)
-    save_data("volumes", VOLUMES)
-    save_data("servers", SERVERS)
-    save_data("attachments", ATTACHMENTS)
+     "created_at": SEED_CREATED_AT}
+])}
+VOLUMES_BY_ID: dict[str, dict] = {v["id"]: v for v in load_data("volumes", [
+    {"id": "vol-1", "name": "vol-1", "size": 1, "status": "available"}
+])}
+SERVERS_BY_ID: dict[str, dict] = {s["id"]: s for s in load_data("servers", [
+    {"id": "srv-1", "name": "server-1", "status": "ACTIVE"}
+])}
+ATTACHMENTS_BY_ID: dict[str, dict] = {a["id"]: a for a in load_data("attachments", [])}
+ATTACHMENTS_BY_KEY: dict[tuple, dict] = {
+    (a["serverId"], a["volumeId"]): a for a in ATTACHMENTS_BY_ID.values()
+}
+ATTACHMENTS_BY_SERVER: dict[str, list] = collections.defaultdict(list)
+for _a in ATTACHMENTS_BY_ID.values():
+    ATTACHMENTS_BY_SERVER[_a["serverId"]].append(_a)
+
+def drop_attachment(attach):
+    del ATTACHMENTS_BY_ID[attach["id"]]
+    ATTACHMENTS_BY_KEY.pop((attach["serverId"], attach["volumeId"]), None)
+    server_attachments = ATTACHMENTS_BY_SERVER[attach["serverId"]]
+    server_attachments.remove(attach)
+    if not server_attachments:
+        del ATTACHMENTS_BY_SERVER[attach["serverId"]]
+
+# --- IDs ---
+# Mayor N emitido por prefijo ("<prefijo>-N"). Se persiste en counters.json y
+# se sube con cada *_add del journal, así un id borrado nunca se reutiliza
+# (los UUID antiguos se ignoran).
+ID_HIGH: dict[str, int] = load_data("counters", {})
+
+def note_id(resource_id):
+    head, _, num = resource_id.partition("-")
+    if num.isdigit() and int(num) > ID_HIGH.get(head, 0):
+        ID_HIGH[head] = int(num)
+
+for _d in (IMAGES_BY_ID, VOLUMES_BY_ID, SERVERS_BY_ID, ATTACHMENTS_BY_ID):
+    for _id in _d:
+        note_id(_id)
+
+def new_id(prefix):
+    ID_HIGH[prefix] = ID_HIGH.get(prefix, 0) + 1
+    return f"{prefix}-{ID_HIGH[prefix]}"
+
+SNAPSHOTS = {
+    "users": lambda: USERS,
+    "counters": lambda: dict(ID_HIGH),
+    "images": lambda: list(IMAGES_BY_ID.values()),
+    "volumes": lambda: list(VOLUMES_BY_ID.values()),
+    "servers": lambda: list(SERVERS_BY_ID.values()),
+    "attachments": lambda: list(ATTACHMENTS_BY_ID.values()),
+}
+
+# --- Journal (append-only) ---
+# Cada mutación escribe una línea {"k": kind, "p": payload} en journal.log;
+# los *.json son el último snapshot y el journal se re-aplica encima al arrancar.
+
+JOURNAL_FILE = os.path.join(DATA_DIR, "journal.log")
+JOURNAL_SYNC_INTERVAL = 1.0   # segundos entre fsyncs agrupados
+COMPACT_INTERVAL = 30.0       # segundos entre snapshots
+COMPACT_EVERY = 1000          # operaciones que fuerzan un snapshot
+FLUSH_DELAY = 0.05            # ventana para agrupar escrituras al journal
+
+# kind prefix -> snapshot que queda desactualizado
+OP_NAMESPACES = {"image": "images", "volume": "volumes", "server": "servers", "attach": "attachments"}
+
+def op_namespace(kind):
+    return OP_NAMESPACES[kind.split("_", 1)[0]]
+
+_dirty: set = set()
+
+def replay_op(kind, p):
+    if kind == "image_add":
+        IMAGES_BY_ID[p["id"]] = p
+    elif kind == "image_del":
+        IMAGES_BY_ID.pop(p["id"], None)
+    elif kind == "volume_add":
+        VOLUMES_BY_ID[p["id"]] = p
+    elif kind == "volume_del":
+        VOLUMES_BY_ID.pop(p["id"], None)
+    elif kind == "server_add":
+        SERVERS_BY_ID[p["id"]] = p
+    elif kind == "server_del":
+        SERVERS_BY_ID.pop(p["id"], None)
+    elif kind == "attach_add":
+        # El snapshot puede traer ya este id (crash entre snapshot y truncate).
+        if p["id"] in ATTACHMENTS_BY_ID:
+            drop_attachment(ATTACHMENTS_BY_ID[p["id"]])
+        ATTACHMENTS_BY_ID[p["id"]] = p
+        ATTACHMENTS_BY_KEY[(p["serverId"], p["volumeId"])] = p
+        ATTACHMENTS_BY_SERVER[p["serverId"]].append(p)
+    elif kind == "attach_del":
+        attach = ATTACHMENTS_BY_ID.get(p["id"])
+        if attach:
+            drop_attachment(attach)
+
+def replay_journal():
+    if not os.path.exists(JOURNAL_FILE):
+        return
+    good = 0
+    with open(JOURNAL_FILE, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                op = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                break  # última línea truncada por un crash
+            replay_op(op["k"], op["p"])
+            _dirty.add(op_namespace(op["k"]))
+            if op["k"].endswith("_add"):
+                note_id(op["p"]["id"])
+                _dirty.add("counters")
+            good += len(line)
+    # Se descarta la cola rota para que los appends siguientes no queden detrás.
+    if good != os.path.getsize(JOURNAL_FILE):
+        os.truncate(JOURNAL_FILE, good)
+
+replay_journal()
+
+# Vista de listado de cada imagen, ya codificada como JSON al insertar y no en
+# cada GET. Cada campo pasa por orjson.dumps, que pone comillas y escapa.
+IMAGE_TEMPLATE = (
+    b'{"id":%b,"name":%b,"status":%b,"size":%b,"visibility":%b,'
+    b'"container_format":%b,"disk_format":%b,"created_at":%b,'
+    b'"links":[{"rel":"self","href":%b}]}'
+)
+
+def image_view(img):
+    return IMAGE_TEMPLATE % tuple(map(orjson.dumps, (
+        img["id"], img["name"], img["status"], img["size"],
+        img.get("visibility", "public"), img.get("container_format", "bare"),
+        img.get("disk_format", "qcow2"), img["created_at"], f"/v2/images/{img['id']}",
+    )))
+
+IMAGE_VIEWS: dict[str, bytes] = {i: image_view(img) for i, img in IMAGES_BY_ID.items()}
+
+# Todo el I/O de disco corre en hilos (asyncio.to_thread); _io_lock ordena
+# las escrituras del journal respecto al truncate de la compactación.
+_io_lock = asyncio.Lock()
+_journal = open(JOURNAL_FILE, "ab", buffering=0)
+_journal_ops = 0
+_journal_unsynced = False
+_last_compact = time.monotonic()
+_pending_ops: list[bytes] = []
+_flush_event = asyncio.Event()
+
+def append_op(kind, payload):
+    # Solo encola la línea; journal_flusher escribe el lote.
+    _pending_ops.append(orjson.dumps({"k": kind, "p": payload}) + b"\n")
+    _dirty.add(op_namespace(kind))
+    if kind.endswith("_add"):
+        _dirty.add("counters")
+    _flush_event.set()
+
+async def flush_pending():
+    global _journal_ops, _journal_unsynced
+    async with _io_lock:
+        if not _pending_ops:
+            return
+        data = b"".join(_pending_ops)
+        _journal_ops += len(_pending_ops)
+        _pending_ops.clear()
+        await asyncio.to_thread(_journal.write, data)
+        _journal_unsynced = True
+
+def _write_snapshot(snapshot):
+    for name, data in snapshot.items():
+        save_data(name, data)
+    _journal.truncate(0)
+
+async def compact_journal():
+    # Snapshot de los namespaces sucios y truncate del journal.
+    global _journal_ops, _journal_unsynced, _last_compact
+    async with _io_lock:
+        # Las vistas se toman en el event loop; lo que llegue durante la
+        # escritura queda en _pending_ops y va al journal ya truncado.
+        snapshot = {name: SNAPSHOTS[name]() for name in _dirty}
+        _pending_ops.clear()
+        _dirty.clear()
+        _journal_ops = 0
+        _journal_unsynced = False
+        _last_compact = time.monotonic()
+        await asyncio.to_thread(_write_snapshot, snapshot)
+
+async def journal_flusher():
+    while True:
+        await _flush_event.wait()
+        await asyncio.sleep(FLUSH_DELAY)
+        _flush_event.clear()
+        await flush_pending()
+
+async def journal_maintainer():
+    global _journal_unsynced
+    while True:
+        await asyncio.sleep(JOURNAL_SYNC_INTERVAL)
+        if _journal_ops >= COMPACT_EVERY or (
+            _journal_ops and time.monotonic() - _last_compact >= COMPACT_INTERVAL
+        ):
+            await compact_journal()
+        elif _journal_unsynced:
+            async with _io_lock:
+                _journal_unsynced = False
+                await asyncio.to_thread(os.fsync, _journal.fileno())
+
+async def start_journal():
+    # Solo si el replay aplicó operaciones; si no, los *.json ya están al día.
+    if _dirty:
+        await compact_journal()
+    app.state.journal_tasks = [
+        asyncio.create_task(journal_flusher()),
+        asyncio.create_task(journal_maintainer()),
+    ]
+
+async def stop_journal():
+    # Cancelar con el lock tomado: ninguna tarea queda a medio escribir.
+    async with _io_lock:
+        for task in app.state.journal_tasks:
+            task.cancel()
+    await asyncio.gather(*app.state.journal_tasks, return_exceptions=True)
+    await compact_journal()
+
+# --- Cache de respuestas ---
+# Los listados se serializan una sola vez y se sirven como bytes hasta que
+# una mutación invalida su clave.
+
+_RESPONSE_CACHE: dict[Any, bytes] = {}
+
+def cached_response(key, render):
+    body = _RESPONSE_CACHE.get(key)
+    if body is None:
+        body = _RESPONSE_CACHE[key] = render()
+    return Response(content=body, media_type="application/json")
+
+def cached_json(key, build):
+    return cached_response(key, lambda: orjson.dumps(build()))
+
+_NO_ATTACHMENTS = orjson.dumps({"volumeAttachments": []})
+
+def invalidate(key):
+    _RESPONSE_CACHE.pop(key, None)
 
 # --- Schemas para tipado ---
 
-class AuthRequest(BaseModel):
-    auth: Dict[str, Any]
+class AuthUser(msgspec.Struct):
+    name: str
+    password: str
+
+class AuthPassword(msgspec.Struct):
+    user: AuthUser
 
-class ImageIn(BaseModel):
+class AuthIdentity(msgspec.Struct):
+    password: AuthPassword
+
+class AuthBody(msgspec.Struct):
+    identity: AuthIdentity
+
+class AuthRequest(msgspec.Struct):
+    auth: AuthBody
+
+_auth_decoder = msgspec.json.Decoder(AuthRequest)
+
+class ImageIn(msgspec.Struct):
     name: str
-    size: Optional[int] = 0
-    visibility: Optional[str] = "private"
-    container_format: Optional[str] = "bare"
-    disk_format: Optional[str] = "qcow2"
+    size: int | None = 0
+    visibility: str | None = "private"
+    container_format: str | None = "bare"
+    disk_format: str | None = "qcow2"
 
-class VolumeIn(BaseModel):
+class VolumeIn(msgspec.Struct):
     name: str
     size: int
 
-class ServerIn(BaseModel):
+class ServerIn(msgspec.Struct):
     name: str
     image_id: str
-    flavor_id: Optional[str] = None
+    flavor_id: str | None = None
+
+def msgspec_body(model):
+    # Dependency que decodifica y valida el body JSON contra `model`.
+    decoder = msgspec.json.Decoder(model, strict=False)
+
+    async def decode(req: Request):
+        try:
+            return decoder.decode(await req.body())
+        except msgspec.DecodeError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return decode
 
 # --- Middleware ---
 
-async def require_token(x_auth_token: str = Header(None)):
-    if not x_auth_token or x_auth_token not in TOKENS:
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
+# Middleware ASGI puro: valida X-Auth-Token una vez antes del routing, en vez
+# de resolver un Depends en cada endpoint.
+
+PROTECTED_PREFIXES = ("/v2/images", "/v3/volumes", "/v2.1/servers")
+_UNAUTHORIZED = orjson.dumps({"detail": "Invalid or missing token"})
+
+class RequireTokenMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(PROTECTED_PREFIXES):
+            token = next((v for k, v in scope["headers"] if k == b"x-auth-token"), None)
+            if token not in VALID_TOKENS:
+                response = Response(_UNAUTHORIZED, status_code=401, media_type="application/json")
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+app.add_middleware(RequireTokenMiddleware)
 
 # --- AUTH (OpenStack Style) ---
 @app.post("/v3/auth/tokens")
 async def get_token(req: Request):
-    data = await req.json()
     try:
-        username = data["auth"]["identity"]["password"]["user"]["name"]
-        password = data["auth"]["identity"]["password"]["user"]["password"]
-    except Exception:
+        creds = _auth_decoder.decode(await req.body()).auth.identity.password.user
+    except msgspec.DecodeError:
         raise HTTPException(status_code=400, detail="Malformed authentication body")
+    username, password = creds.name, creds.password
     user = USERS.get(username)
     if not user or user["password"] != password:
         raise HTTPException(status_code=401, detail="Bad credentials")
-    token = str(uuid.uuid4())
+    token = secrets.token_hex(16)
     TOKENS[token] = user["id"]
-    persist_all()
-    response = JSONResponse(content={
+    VALID_TOKENS.add(token.encode())
+    response = ORJSONResponse(content={
         "token": token,
         "user": {"id": user["id"], "name": username, "role": user["role"]},
         "project": {"id": "mock-project", "name": "MockProject"}
@@ -106,129 +401,115 @@ async def get_token(req: Request):
 
 # --- IMAGES ---
 @app.get("/v2/images")
-def list_images(token=Depends(require_token)):
-    return {
-        "images": [
-            {
-                "id": img["id"], "name": img["name"], "status": img["status"],
-                "size": img["size"], "visibility": img.get("visibility", "public"),
-                "container_format": img.get("container_format", "bare"),
-                "disk_format": img.get("disk_format", "qcow2"),
-                "created_at": img.get("created_at", now_iso()),
-                "links": [{"rel": "self", "href": f"/v2/images/{img['id']}"}]
-            }
-            for img in IMAGES
-        ]
-    }
+async def list_images():
+    return cached_response("images", lambda: b'{"images":[' + b",".join(IMAGE_VIEWS.values()) + b"]}")
 
 @app.post("/v2/images", status_code=201)
-async def create_image(img: ImageIn, token=Depends(require_token)):
+async def create_image(img: ImageIn = Depends(msgspec_body(ImageIn))):
     new_img = {
-        "id": str(uuid.uuid4()), "name": img.name, "status": "queued", "size": img.size,
+        "id": new_id("img"), "name": img.name, "status": "queued", "size": img.size,
         "visibility": img.visibility, "container_format": img.container_format,
         "disk_format": img.disk_format, "created_at": now_iso()
     }
-    IMAGES.append(new_img)
-    persist_all()
+    IMAGES_BY_ID[new_img["id"]] = new_img
+    IMAGE_VIEWS[new_img["id"]] = image_view(new_img)
+    invalidate("images")
+    append_op("image_add", new_img)
     return new_img
 
 @app.get("/v2/images/{image_id}")
-def get_image(image_id: str, token=Depends(require_token)):
-    for img in IMAGES:
-        if img["id"] == image_id:
-            return img
-    raise HTTPException(status_code=404, detail="Image not found")
+async def get_image(image_id: str):
+    img = IMAGES_BY_ID.get(image_id)
+    if not img:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return img
 
 @app.delete("/v2/images/{image_id}")
-def delete_image(image_id: str, token=Depends(require_token)):
-    global IMAGES
-    before = len(IMAGES)
-    IMAGES = [img for img in IMAGES if img["id"] != image_id]
-    persist_all()
-    if len(IMAGES) == before:
+async def delete_image(image_id: str):
+    if IMAGES_BY_ID.pop(image_id, None) is None:
         raise HTTPException(404, "Image not found")
+    del IMAGE_VIEWS[image_id]
+    invalidate("images")
+    append_op("image_del", {"id": image_id})
     return {"detail": "Deleted"}
 
 # --- VOLUMES ---
 @app.get("/v3/volumes")
-def list_volumes(token=Depends(require_token)):
-    return {"volumes": VOLUMES}
+async def list_volumes():
+    return cached_json("volumes", lambda: {"volumes": list(VOLUMES_BY_ID.values())})
 
 @app.post("/v3/volumes", status_code=201)
-async def create_volume(vol: VolumeIn, token=Depends(require_token)):
-    new_vol = {"id": str(uuid.uuid4()), "name": vol.name, "size": vol.size, "status": "available"}
-    VOLUMES.append(new_vol)
-    persist_all()
+async def create_volume(vol: VolumeIn = Depends(msgspec_body(VolumeIn))):
+    new_vol = {"id": new_id("vol"), "name": vol.name, "size": vol.size, "status": "available"}
+    VOLUMES_BY_ID[new_vol["id"]] = new_vol
+    invalidate("volumes")
+    append_op("volume_add", new_vol)
     return new_vol
 
 @app.get("/v3/volumes/{volume_id}")
-def get_volume(volume_id: str, token=Depends(require_token)):
-    for vol in VOLUMES:
-        if vol["id"] == volume_id:
-            return vol
-    raise HTTPException(status_code=404, detail="Volume not found")
+async def get_volume(volume_id: str):
+    vol = VOLUMES_BY_ID.get(volume_id)
+    if not vol:
+        raise HTTPException(status_code=404, detail="Volume not found")
+    return vol
 
 @app.delete("/v3/volumes/{volume_id}")
-def delete_volume(volume_id: str, token=Depends(require_token)):
-    global VOLUMES
-    before = len(VOLUMES)
-    VOLUMES = [vol for vol in VOLUMES if vol["id"] != volume_id]
-    persist_all()
-    if len(VOLUMES) == before:
+async def delete_volume(volume_id: str):
+    if VOLUMES_BY_ID.pop(volume_id, None) is None:
         raise HTTPException(404, "Volume not found")
+    invalidate("volumes")
+    append_op("volume_del", {"id": volume_id})
     return {"detail": "Deleted"}
 
 # --- SERVERS ---
 @app.get("/v2.1/servers")
-def list_servers(token=Depends(require_token)):
-    return {"servers": SERVERS}
+async def list_servers():
+    return cached_json("servers", lambda: {"servers": list(SERVERS_BY_ID.values())})
 
 @app.post("/v2.1/servers", status_code=202)
-async def create_server(srv: ServerIn, token=Depends(require_token)):
+async def create_server(srv: ServerIn = Depends(msgspec_body(ServerIn))):
     new_srv = {
-        "id": str(uuid.uuid4()), "name": srv.name, "status": "BUILD",
+        "id": new_id("srv"), "name": srv.name, "status": "BUILD",
         "image_id": srv.image_id, "flavor_id": srv.flavor_id
     }
-    SERVERS.append(new_srv)
-    persist_all()
+    SERVERS_BY_ID[new_srv["id"]] = new_srv
+    invalidate("servers")
+    append_op("server_add", new_srv)
     return new_srv
 
 @app.get("/v2.1/servers/{server_id}")
-def get_server(server_id: str, token=Depends(require_token)):
-    for srv in SERVERS:
-        if srv["id"] == server_id:
-            return srv
-    raise HTTPException(status_code=404, detail="Server not found")
+async def get_server(server_id: str):
+    srv = SERVERS_BY_ID.get(server_id)
+    if not srv:
+        raise HTTPException(status_code=404, detail="Server not found")
+    return srv
 
 @app.delete("/v2.1/servers/{server_id}")
-def delete_server(server_id: str, token=Depends(require_token)):
-    global SERVERS
-    before = len(SERVERS)
-    SERVERS = [srv for srv in SERVERS if srv["id"] != server_id]
-    persist_all()
-    if len(SERVERS) == before:
+async def delete_server(server_id: str):
+    if SERVERS_BY_ID.pop(server_id, None) is None:
         raise HTTPException(404, "Server not found")
+    invalidate("servers")
+    append_op("server_del", {"id": server_id})
     return {"detail": "Deleted"}
 
 # --- LOGOUT (optional) ---
 @app.post("/v3/auth/logout")
-def logout(x_auth_token: str = Header(None)):
-    TOKENS.pop(x_auth_token, None)
-    persist_all()
+async def logout(x_auth_token: str = Header(None)):
+    if TOKENS.pop(x_auth_token, None) is not None:
+        VALID_TOKENS.discard(x_auth_token.encode())
     return {"detail": "Logged out"}
 
 # --- ATTACHMENTS ---
 
 @app.post("/v2.1/servers/{server_id}/os-volume_attachments", status_code=202)
-async def attach_volume(server_id: str, body: dict, token=Depends(require_token)):
+async def attach_volume(server_id: str, body: dict):
     volume_id = body.get("volumeId") or body.get("volume_id")
     device = body.get("device", "/dev/vdb")
     if not volume_id:
         raise HTTPException(400, "Missing volumeId")
-    for attach in ATTACHMENTS:
-        if attach["serverId"] == server_id and attach["volumeId"] == volume_id:
-            raise HTTPException(409, "Already attached")
-    attach_id = str(uuid.uuid4())
+    if (server_id, volume_id) in ATTACHMENTS_BY_KEY:
+        raise HTTPException(409, "Already attached")
+    attach_id = new_id("att")
     new_attach = {
         "id": attach_id,
         "serverId": server_id,
@@ -236,24 +517,29 @@ async def attach_volume(server_id: str, body: dict, token=Depends(require_token)
         "device": device,
         "attached_at": now_iso()
     }
-    ATTACHMENTS.append(new_attach)
-    persist_all()
+    ATTACHMENTS_BY_ID[attach_id] = new_attach
+    ATTACHMENTS_BY_KEY[(server_id, volume_id)] = new_attach
+    ATTACHMENTS_BY_SERVER[server_id].append(new_attach)
+    invalidate(("attachments", server_id))
+    append_op("attach_add", new_attach)
     # OpenStack responde {"volumeAttachment": {...}}
     return {"volumeAttachment": new_attach}
 
 @app.get("/v2.1/servers/{server_id}/os-volume_attachments")
-def list_attachments(server_id: str, token=Depends(require_token)):
-    vols = [a for a in ATTACHMENTS if a["serverId"] == server_id]
-    return {"volumeAttachments": vols}
+async def list_attachments(server_id: str):
+    # Sin adjuntos no se cachea: cualquier server_id desconocido crearía una entrada.
+    if server_id not in ATTACHMENTS_BY_SERVER:
+        return Response(content=_NO_ATTACHMENTS, media_type="application/json")
+    return cached_json(("attachments", server_id), lambda: {
+        "volumeAttachments": ATTACHMENTS_BY_SERVER[server_id]
+    })
 
 @app.delete("/v2.1/servers/{server_id}/os-volume_attachments/{attachment_id}", status_code=204)
-def detach_volume(server_id: str, attachment_id: str, token=Depends(require_token)):
-    before = len(ATTACHMENTS)
-    ATTACHMENTS[:] = [
-        a for a in ATTACHMENTS
-        if not (a["serverId"] == server_id and a["id"] == attachment_id)
-    ]
-    persist_all()
-    if len(ATTACHMENTS) == before:
+async def detach_volume(server_id: str, attachment_id: str):
+    attach = ATTACHMENTS_BY_ID.get(attachment_id)
+    if not attach or attach["serverId"] != server_id:
         raise HTTPException(404, "Attachment not found")
+    drop_attachment(attach)
+    invalidate(("attachments", server_id))
+    append_op("attach_del", {"serverId": server_id, "id": attachment_id})
     return
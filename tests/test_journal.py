@@ -0,0 +1,110 @@
+import importlib
+import shutil
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    shutil.copytree(REPO / "mock_data", tmp_path / "mock_data")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(REPO))
+    yield tmp_path / "mock_data"
+    sys.modules.pop("mock_openstack", None)
+
+
+def boot():
+    sys.modules.pop("mock_openstack", None)
+    return importlib.import_module("mock_openstack")
+
+
+def write_journal(data_dir, *ops):
+    with open(data_dir / "journal.log", "wb") as f:
+        for kind, payload in ops:
+            f.write(orjson.dumps({"k": kind, "p": payload}) + b"\n")
+
+
+def test_replay_attach_add_already_in_snapshot(data_dir):
+    attach = {"id": "att-1", "serverId": "srv-1", "volumeId": "vol-1",
+              "device": "/dev/vdb", "attached_at": "2024-08-01T00:00:00Z"}
+    (data_dir / "attachments.json").write_bytes(orjson.dumps([attach]))
+    write_journal(data_dir, ("attach_add", attach))
+
+    m = boot()
+    assert m.ATTACHMENTS_BY_SERVER["srv-1"] == [attach]
+
+    m.drop_attachment(m.ATTACHMENTS_BY_ID["att-1"])
+    assert "srv-1" not in m.ATTACHMENTS_BY_SERVER
+    assert not m.ATTACHMENTS_BY_KEY
+
+
+def test_truncated_journal_tail_is_discarded(data_dir):
+    vol = {"id": "vol-9", "name": "v", "size": 1, "status": "available"}
+    write_journal(data_dir, ("volume_add", vol))
+    with open(data_dir / "journal.log", "ab") as f:
+        f.write(b'{"k":"volume_del","p":{"id"')
+
+    m = boot()
+    assert m.VOLUMES_BY_ID["vol-9"] == vol
+    assert (data_dir / "journal.log").read_bytes().endswith(b"}\n")
+
+
+def test_startup_without_journal_keeps_snapshots(data_dir):
+    from fastapi.testclient import TestClient
+
+    before = {p.name: p.stat().st_mtime_ns for p in data_dir.glob("*.json")}
+    with TestClient(boot().app):
+        pass
+    assert {p.name: p.stat().st_mtime_ns for p in data_dir.glob("*.json")} == before
+
+
+def test_deleted_highest_id_is_not_reused(data_dir):
+    write_journal(
+        data_dir,
+        ("volume_add", {"id": "vol-2", "name": "a", "size": 1, "status": "available"}),
+        ("volume_add", {"id": "vol-3", "name": "b", "size": 1, "status": "available"}),
+        ("volume_del", {"id": "vol-3"}),
+    )
+    assert boot().new_id("vol") == "vol-4"
+
+
+def test_id_counters_survive_compaction(data_dir):
+    from fastapi.testclient import TestClient
+
+    write_journal(
+        data_dir,
+        ("volume_add", {"id": "vol-3", "name": "b", "size": 1, "status": "available"}),
+        ("volume_del", {"id": "vol-3"}),
+    )
+    with TestClient(boot().app):
+        pass
+    assert (data_dir / "journal.log").stat().st_size == 0
+    assert boot().new_id("vol") == "vol-4"
+
+
+def test_unknown_server_attachments_are_not_cached(data_dir):
+    from fastapi.testclient import TestClient
+
+    m = boot()
+    with TestClient(m.app) as c:
+        token = c.post("/v3/auth/tokens", json={"auth": {"identity": {"password": {
+            "user": {"name": "admin", "password": "secret"}}}}}).headers["X-Subject-Token"]
+        r = c.get("/v2.1/servers/nope/os-volume_attachments", headers={"X-Auth-Token": token})
+    assert r.json() == {"volumeAttachments": []}
+    assert ("attachments", "nope") not in m._RESPONSE_CACHE
+
+
+def test_create_volume_coerces_numeric_strings(data_dir):
+    from fastapi.testclient import TestClient
+
+    with TestClient(boot().app) as c:
+        token = c.post("/v3/auth/tokens", json={"auth": {"identity": {"password": {
+            "user": {"name": "admin", "password": "secret"}}}}}).headers["X-Subject-Token"]
+        r = c.post("/v3/volumes", json={"name": "v", "size": "3"}, headers={"X-Auth-Token": token})
+    assert r.status_code == 201
+    assert r.json()["size"] == 3